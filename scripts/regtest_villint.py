@@ -4,13 +4,16 @@
 Regression test framework for villint.sh
 
 This script creates a temporary git worktree and runs test cases to verify
-that villint.sh correctly fixes various style guide violations.
+that villint.sh correctly fixes various style guide violations. Test cases are
+spread across worker processes (see --jobs), each working in its own clone or
+worktree.
 
 Each test case named <foo> comprises:
   - <name>_edit.sh: Creates a style violation or makes a valid change
   - <name>_verify.sh: Checks if the code meets the style guide (exit 0 = pass, 1 = fail)
   - <name>_properties.env: Optional properties file with test configuration
   - <name>_commit.txt: Optional commit message to create after edit script runs
+                        (passed to git commit -F as is, so it can be of any length)
 
 Properties file options:
   UNFIXABLE=true       Expects villint.sh to fail (cannot auto-fix). Verify should fail both before and after.
@@ -31,13 +34,20 @@ Standard test procedure:
 """
 
 import argparse
+import contextlib
 import os
+import random
+import re
+import shlex
+import shutil
+import stat
+import string
 import subprocess
 import sys
 import tempfile
-import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 
 class Colors:
@@ -50,19 +60,59 @@ class Colors:
     BOLD = '\033[1m'
 
 
-def run_command(cmd: List[str], cwd: str, check: bool = True) -> Tuple[int, str, str]:
-    """Run a command and return (returncode, stdout, stderr)"""
+def run_command(
+    cmd: List[str], check: bool = True, decode: bool = False
+) -> Tuple[int, Union[bytes, str], Union[bytes, str]]:
+    """Run a command and return (returncode, stdout, stderr)
+
+    Output is returned as bytes unless decode=True, since most callers never
+    look at it. A raised CalledProcessError always carries decoded output.
+    """
     result = subprocess.run(
         cmd,
-        cwd=cwd,
         capture_output=True,
-        text=True,
     )
+    stdout, stderr = result.stdout, result.stderr
+    if decode or (check and result.returncode != 0):
+        stdout = stdout.decode(errors="replace")
+        stderr = stderr.decode(errors="replace")
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(
+            result.returncode, cmd, stdout, stderr
+        )
+    return result.returncode, stdout, stderr
+
+
+def run_command_streaming(cmd: List[str], check: bool = True) -> Tuple[int, str]:
+    """Run a command with its stdout going straight to ours; return (returncode, stderr)
+
+    The output shows up as it is produced instead of being held in memory and
+    printed afterwards. Only stderr is captured, for error reporting.
+    """
+    # Anything we printed so far must come out before the command's output.
+    # sys.stdout rather than our fd 1, so that a worker's per-test log
+    # (see run_one) receives the output too.
+    sys.stdout.flush()
+    result = subprocess.run(
+        cmd,
+        stdout=sys.stdout,
+        stderr=subprocess.PIPE,
+    )
+    stderr = result.stderr.decode(errors="replace")
     if check and result.returncode != 0:
         raise subprocess.CalledProcessError(
-            result.returncode, cmd, result.stdout, result.stderr
+            result.returncode, cmd, None, stderr
         )
-    return result.returncode, result.stdout, result.stderr
+    return result.returncode, stderr
+
+
+def find_entries(directory: str, prefix: str) -> List[str]:
+    """Return paths of the entries in directory whose names start with prefix"""
+    try:
+        with os.scandir(directory) as entries:
+            return [entry.path for entry in entries if entry.name.startswith(prefix)]
+    except FileNotFoundError:
+        return []
 
 
 def print_status(message: str, color: str = Colors.BLUE):
@@ -85,6 +135,13 @@ def print_warning(message: str):
     print(f"{Colors.YELLOW}⚠ {message}{Colors.RESET}")
 
 
+# KEY=value lines of a test case's properties file that TestCase understands
+PROPERTY_RE = re.compile(
+    rb'^[ \t]*(UNFIXABLE|NO_VIOLATION|PRESERVE_MTIME)[ \t]*=[ \t]*(.*?)[ \t\r]*$', re.MULTILINE
+)
+TRUE_VALUES = {b'true', b'1', b'yes'}
+
+
 class TestCase:
     """Represents a single villint test case"""
 
@@ -98,26 +155,16 @@ class TestCase:
         self.no_violation = False
         self.preserve_mtime = False
 
-        # Load properties if file exists
-        if properties_file and properties_file.exists():
+        # Load properties if file exists (callers only pass files that do)
+        if properties_file:
             self._load_properties()
 
     def _load_properties(self):
         """Load properties from the properties file"""
-        with open(self.properties_file, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    if '=' in line:
-                        key, value = line.split('=', 1)
-                        key = key.strip()
-                        value = value.strip()
-                        if key == 'UNFIXABLE':
-                            self.unfixable = value.lower() in ('true', '1', 'yes')
-                        elif key == 'NO_VIOLATION':
-                            self.no_violation = value.lower() in ('true', '1', 'yes')
-                        elif key == 'PRESERVE_MTIME':
-                            self.preserve_mtime = value.lower() in ('true', '1', 'yes')
+        # Each key maps onto the attribute of the same name, lowercased
+        with open(self.properties_file, 'rb') as f:
+            for match in PROPERTY_RE.finditer(f.read()):
+                setattr(self, match.group(1).decode().lower(), match.group(2).lower() in TRUE_VALUES)
 
     def __str__(self):
         return self.name
@@ -126,109 +173,341 @@ class TestCase:
 class VillintTestRunner:
     """Runs villint regression tests"""
 
-    def __init__(self, source_dir: Path, base_branch: str = "origin/main", debug: bool = False):
-        self.source_dir = source_dir
+    def __init__(self, source_dir: Path, base_branch: str = "origin/main", debug: bool = False, jobs: int = 1,
+                 use_worktree: bool = False):
+        # Absolute, since we chdir into the test repo
+        self.source_dir = source_dir.resolve()
         self.base_branch = base_branch
-        self.villint_script = source_dir / "scripts" / "villint.sh"
-        self.test_cases_dir = source_dir / "scripts" / "regtest_villint_test_cases"
+        self.jobs = jobs
+        self.use_worktree = use_worktree
+        self.villint_script = self.source_dir / "scripts" / "villint.sh"
+        self.test_cases_dir = self.source_dir / "scripts" / "regtest_villint_test_cases"
         self.temp_dir = None
         self.test_branch = None
         self.debug = debug
+        self.source_objects_dir = None
+        self.source_shallow_file = None
+        # Whether the test repo may differ from base_commit. A freshly set up
+        # repo is clean, so the first test in it needs no reset.
+        self._dirty = False
+        # Long-lived shell that runs the edit and verify scripts, see _exec_script()
+        self._bash = None
+        self._script_stdout = None
+        self._script_stderr = None
+        # False once the shell turned out to be older than bash 5
+        self._bash_sources_scripts = True
+        # Working directory to return to once the test repo is removed
+        self._original_cwd = None
 
     def discover_test_cases(self) -> List[TestCase]:
         """Discover all test cases in the test_cases directory"""
-        test_cases = {}
+        test_cases = []
 
-        if not self.test_cases_dir.exists():
+        # List the directory once and match up each test's files by name,
+        # rather than stat-ing every candidate file
+        try:
+            with os.scandir(self.test_cases_dir) as entries:
+                names = {entry.name for entry in entries if entry.is_file()}
+        except FileNotFoundError:
             print_error(f"Test cases directory not found: {self.test_cases_dir}")
             return []
 
-        for script_file in self.test_cases_dir.glob("*_edit.sh"):
-            # Extract test name by removing _edit.sh suffix
-            test_name = script_file.stem[:-5]  # Remove _edit
-            verify_file = self.test_cases_dir / f"{test_name}_verify.sh"
-            properties_file = self.test_cases_dir / f"{test_name}_properties.env"
-            commit_file = self.test_cases_dir / f"{test_name}_commit.txt"
-
-            if verify_file.exists():
-                test_cases[test_name] = TestCase(
+        edit_suffix = "_edit.sh"
+        for name in sorted(names):
+            if not name.endswith(edit_suffix):
+                continue
+            test_name = name[:-len(edit_suffix)]
+            verify_name = f"{test_name}_verify.sh"
+            properties_name = f"{test_name}_properties.env"
+            commit_name = f"{test_name}_commit.txt"
+
+            if verify_name in names:
+                test_cases.append(TestCase(
                     test_name,
-                    script_file,
-                    verify_file,
-                    properties_file if properties_file.exists() else None,
-                    commit_file if commit_file.exists() else None
-                )
+                    self.test_cases_dir / name,
+                    self.test_cases_dir / verify_name,
+                    self.test_cases_dir / properties_name if properties_name in names else None,
+                    self.test_cases_dir / commit_name if commit_name in names else None
+                ))
             else:
-                print_warning(f"Found {script_file.name} but no matching verify script")
-
-        return list(test_cases.values())
+                print_warning(f"Found {name} but no matching verify script")
 
-    def setup_test_repo(self):
-        """Create a temporary git clone for testing"""
-        print_status(f"Setting up test repository...")
+        return test_cases
 
-        # Resolve base_branch to a commit SHA in the source repo BEFORE cloning.
-        # This is necessary because git clone creates origin/* refs from the
-        # source repo's BRANCHES, not its remote-tracking branches. So the clone's
-        # origin/main would be the source's local "main" branch, not "origin/main".
+    def resolve_base_commit(self):
+        """Resolve base_branch to a commit SHA, and find the source repo's object store"""
+        # Resolve base_branch to a commit SHA in the source repo BEFORE setting up
+        # the test repo. The test repo doesn't get the source repo's refs, so
+        # base_branch (typically the remote-tracking origin/main) can't be
+        # resolved there. The common dir is where the objects live even when
+        # source_dir is itself a worktree.
         returncode, stdout, stderr = run_command(
-            ["git", "rev-parse", self.base_branch],
-            cwd=str(self.source_dir),
+            ["git", "-C", str(self.source_dir), "rev-parse",
+             "--path-format=absolute", "--git-common-dir", self.base_branch],
+            decode=True,
         )
-        self.base_commit = stdout.strip()
+        git_common_dir, self.base_commit = stdout.splitlines()
+        self.source_objects_dir = Path(git_common_dir) / "objects"
+        # Present only in shallow repos (e.g. CI checkouts with fetch-depth: 1)
+        self.source_shallow_file = Path(git_common_dir) / "shallow"
+
+        # A worktree shares its refs with the source repo, so unlike a clone we
+        # can't point its origin/main at base_commit without moving the user's
+        # own origin/main. That only works out if the two already agree.
+        if self.use_worktree:
+            returncode, stdout, stderr = run_command(
+                ["git", "-C", str(self.source_dir), "rev-parse", "--verify", "--quiet", "origin/main"],
+                check=False,
+                decode=True,
+            )
+            if stdout.strip() != self.base_commit:
+                print_warning(f"origin/main is not {self.base_branch}, using clones instead of worktrees")
+                self.use_worktree = False
 
-        # Generate random suffix for directory name
-        import random
-        import string
+    def new_temp_dir(self) -> Path:
+        """Pick a fresh /tmp/villint_regtest_<random> path"""
         random_suffix = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
-        dir_name = f"villint_regtest_{random_suffix}"
+        return Path("/tmp") / f"villint_regtest_{random_suffix}"
+
+    def setup_test_repo(self, temp_dir: Path = None):
+        """Create a temporary git clone (or worktree) of base_commit for testing"""
+        print_status(f"Setting up test repository...")
+
         self.test_branch = None  # Not using branches with clone
+        self.temp_dir = temp_dir or self.new_temp_dir()
+
+        if self.use_worktree:
+            # A detached worktree shares the source repo's objects and refs, so
+            # there is no repo to initialize and origin/main is already right.
+            print_status(f"  Creating worktree: {self.temp_dir}")
+            run_command(
+                ["git", "-C", str(self.source_dir), "worktree", "add", "--detach", str(self.temp_dir), self.base_commit],
+            )
+            self._enter_test_repo()
+            print_success("Test repository setup complete")
+            return
 
-        # Create temp directory path
-        self.temp_dir = Path("/tmp") / dir_name
         print_status(f"  Creating clone: {self.temp_dir}")
 
-        # Use git clone --shared instead of worktree to avoid VSCode tracking.
+        # Without --use-worktree, use a separate repo to avoid VSCode tracking.
         # Worktrees are registered in .git/worktrees/ which VSCode monitors, causing
-        # "too many active changes" popups. Shared clones reference the same objects
-        # but are independent repos, so VSCode doesn't see them.
+        # "too many active changes" popups. A separate repo is invisible to VSCode.
+        #
+        # Rather than git clone --shared, which also writes a remote, copies all
+        # of the source repo's refs and so on, build the repo by hand: an empty
+        # repo that borrows the source repo's objects through the alternates file
+        # (which is all --shared does), plus the single ref villint.sh needs.
         run_command(
-            ["git", "clone", "--shared", "--no-checkout", str(self.source_dir), str(self.temp_dir)],
-            cwd="/tmp",
+            ["git", "init", "-q", str(self.temp_dir)],
         )
-
-        # Checkout the resolved commit (not the ref name, see comment above)
+        self._enter_test_repo()
+        alternates = self.temp_dir / ".git" / "objects" / "info" / "alternates"
+        alternates.write_text(f"{self.source_objects_dir}\n")
+
+        # The objects of a shallow source repo stop at its shallow boundary.
+        # Without the list of boundary commits, git treats them as having full
+        # history and fails reading their missing parents (e.g. in villint.sh's
+        # merge-base), so the test repo needs the same list.
+        if self.source_shallow_file.exists():
+            shutil.copyfile(self.source_shallow_file, self.temp_dir / ".git" / "shallow")
+
+        # Point origin/main at the base commit, so that villint.sh's merge-base
+        # calculation uses it and doesn't see too many files as "changed".
         run_command(
-            ["git", "checkout", self.base_commit],
-            cwd=str(self.temp_dir),
+            ["git", "update-ref", "refs/remotes/origin/main", self.base_commit],
         )
 
-        # Fix the origin/main ref in the clone to point to the correct commit.
-        # Without this, villint.sh's merge-base calculation would use the wrong
-        # origin/main and see too many files as "changed".
+        # Check out the base commit
         run_command(
-            ["git", "update-ref", "refs/remotes/origin/main", self.base_commit],
-            cwd=str(self.temp_dir),
+            ["git", "reset", "-q", "--hard", self.base_commit],
         )
 
         print_success("Test repository setup complete")
 
+    def copy_test_repo(self, template_dir: Path, temp_dir: Path):
+        """Create a test clone by copying an already set up one"""
+        # This is a real copy rather than a hardlinked one (cp -al): edit scripts
+        # append to files in place, which through shared inodes would leak into
+        # the template and every other worker. On copy-on-write filesystems
+        # --reflink=auto still makes the copy a metadata-only operation.
+        self.test_branch = None
+        self.temp_dir = temp_dir
+        print_status(f"  Copying clone: {self.temp_dir}")
+        cmd = ["cp", "-a"]
+        if sys.platform.startswith("linux"):
+            cmd.append("--reflink=auto")
+        run_command(cmd + [str(template_dir), str(self.temp_dir)])
+        self._enter_test_repo()
+
+    def _enter_test_repo(self):
+        """Make the test repo our working directory, for us and every command we run"""
+        # Commands then inherit the right directory instead of each child
+        # having to chdir into it, hence no cwd= on the calls in this file.
+        # Parallel workers are separate processes, each in its own directory.
+        if self._original_cwd is None:
+            self._original_cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+
     def cleanup_test_repo(self):
-        """Remove test clone directory"""
-        if self.temp_dir and self.temp_dir.exists():
-            print_status(f"Removing test clone: {self.temp_dir}")
-            try:
-                import shutil
-                shutil.rmtree(self.temp_dir)
-            except Exception as e:
-                print_warning(f"Could not remove test clone: {e}")
+        """Remove test clone directory, and any per-worker clones next to it"""
+        self._stop_bash()
+        if self._original_cwd is not None:
+            os.chdir(self._original_cwd)
+            self._original_cwd = None
+        if not self.temp_dir:
+            return
+        worker_dirs = find_entries(str(self.temp_dir.parent), f"{self.temp_dir.name}_")
+        clone_dirs = [self.temp_dir] + [Path(d) for d in worker_dirs]
+        clone_dirs = [d for d in clone_dirs if d.exists()]
+        for clone_dir in clone_dirs:
+            print_status(f"Removing test clone: {clone_dir}")
+
+        # Remove all clones concurrently, so cleanup takes as long as the
+        # largest clone rather than the sum of all of them
+        removals = [subprocess.Popen(["rm", "-rf", str(d)]) for d in clone_dirs]
+        for clone_dir, removal in zip(clone_dirs, removals):
+            if removal.wait() != 0:
+                print_warning(f"Could not remove test clone: {clone_dir}")
+
+        if self.use_worktree:
+            # Drop the registrations of our own worktrees only (not git worktree
+            # prune, which would also drop the user's worktrees that merely
+            # happen to be missing, e.g. on an unmounted drive). The
+            # directories are gone already, so this just removes git's entries.
+            removals = [
+                subprocess.Popen(
+                    ["git", "-C", str(self.source_dir), "worktree", "remove", "--force", str(d)],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                for d in clone_dirs
+            ]
+            for clone_dir, removal in zip(clone_dirs, removals):
+                if removal.wait() != 0:
+                    print_warning(f"Could not remove worktree registration: {clone_dir}")
 
     def reset_to_clean_state(self):
         """Reset the test repository to a clean state"""
+        if not self._dirty:
+            return
         # Reset to the base commit (resolved from origin/main), not HEAD
         # This ensures commits from previous tests don't pollute subsequent tests
-        run_command(["git", "reset", "--hard", self.base_commit], cwd=str(self.temp_dir))
-        run_command(["git", "clean", "-fd"], cwd=str(self.temp_dir))
+        run_command(["git", "reset", "--hard", self.base_commit])
+        run_command(["git", "clean", "-fd"])
+        self._dirty = False
+
+    def _exec_script(
+        self, script: Path, check: bool = True, decode: bool = False
+    ) -> Tuple[int, Union[bytes, str], Union[bytes, str]]:
+        """Run a bash script in the test repo and return (returncode, stdout, stderr)
+
+        Scripts are sourced in a subshell of one long-lived bash process, which
+        forks instead of starting (and initializing) a new bash for every
+        script. Output and decoding behave as in run_command().
+
+        $0 is set to the script path as with "bash script". $$ however is the
+        long-lived shell's PID, shared by all scripts run by this runner; use
+        $BASHPID for a per-script PID.
+
+        Setting $0 needs bash 5 or later, so with an older bash (e.g. the one
+        shipped with macOS) each script runs as "bash script" instead.
+        """
+        if self._bash is None and self._bash_sources_scripts:
+            self._start_bash()
+        if not self._bash_sources_scripts:
+            return run_command(["bash", str(script)], check=check, decode=decode)
+
+        for f in (self._script_stdout, self._script_stderr):
+            f.seek(0)
+            f.truncate()
+
+        # The shell's stdout only carries the sentinel line with the exit
+        # status; the script writes to the temp files through duplicated fds.
+        # The shell started in the test repo, and the subshell keeps a script's
+        # cd from affecting later ones.
+        quoted_script = shlex.quote(str(script))
+        try:
+            self._bash.stdin.write(
+                f"(BASH_ARGV0={quoted_script}; source {quoted_script}) "
+                f"</dev/null >&{self._script_stdout.fileno()} 2>&{self._script_stderr.fileno()}; "
+                f"printf '__DONE__ %d\\n' $?\n".encode()
+            )
+            self._bash.stdin.flush()
+            line = self._bash.stdout.readline()
+        except BrokenPipeError:
+            line = b""
+        if not line.startswith(b"__DONE__ "):
+            # Whatever killed the shell failed this script only; the next
+            # script gets a fresh shell
+            self._stop_bash()
+            raise RuntimeError(f"bash exited while running {script}")
+        returncode = int(line.split()[1])
+
+        self._script_stdout.seek(0)
+        stdout = self._script_stdout.read()
+        self._script_stderr.seek(0)
+        stderr = self._script_stderr.read()
+        if decode or (check and returncode != 0):
+            stdout = stdout.decode(errors="replace")
+            stderr = stderr.decode(errors="replace")
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode, ["bash", str(script)], stdout, stderr
+            )
+        return returncode, stdout, stderr
+
+    def _start_bash(self):
+        """Start the long-lived bash process, unless it is too old to set $0"""
+        self._script_stdout = tempfile.TemporaryFile()
+        self._script_stderr = tempfile.TemporaryFile()
+        self._bash = subprocess.Popen(
+            ["bash", "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            pass_fds=(self._script_stdout.fileno(), self._script_stderr.fileno()),
+        )
+        try:
+            self._bash.stdin.write(b"printf '%d\\n' \"${BASH_VERSINFO[0]}\"\n")
+            self._bash.stdin.flush()
+            major = self._bash.stdout.readline().strip()
+        except BrokenPipeError:
+            major = b""
+        if not major.isdigit() or int(major) < 5:
+            self._bash_sources_scripts = False
+            self._stop_bash()
+
+    def _stop_bash(self):
+        """Shut down the long-lived bash process, if it was started"""
+        if self._bash is not None:
+            # The shell may be dead already, e.g. after a script ran kill $$
+            with contextlib.suppress(OSError):
+                self._bash.stdin.close()
+            self._bash.stdout.close()
+            self._bash.wait()
+            self._bash = None
+            self._script_stdout.close()
+            self._script_stderr.close()
+
+    def _git_status(self) -> List[Tuple[str, str]]:
+        """Return (XY status, path) for every change in the test clone, untracked files included"""
+        returncode, stdout, stderr = run_command(
+            ["git", "status", "--porcelain", "-z", "--untracked-files=all"],
+        )
+        entries = []
+        fields = iter(stdout.split(b'\0'))
+        for field in fields:
+            if not field:
+                continue
+            status, file_path = field[:2].decode(), os.fsdecode(field[3:])
+            if status[0] in 'RC':
+                # Renames and copies are followed by their source path
+                next(fields, None)
+            entries.append((status, file_path))
+        return entries
+
+    def _list_changed_files(self) -> List[str]:
+        """List modified, added and untracked files, i.e. what villint.sh will process"""
+        return [file_path for status, file_path in self._git_status() if 'D' not in status]
 
     def run_test_case(self, test_case: TestCase) -> bool:
         """Run a single test case. Returns True if passed, False if failed."""
@@ -255,9 +534,10 @@ class VillintTestRunner:
                 print_status("Running edit script (making valid change)...")
             else:
                 print_status("Running edit script (creating violation)...")
-            returncode, stdout, stderr = run_command(
-                ["bash", str(test_case.edit_script)],
-                cwd=str(self.temp_dir),
+            self._dirty = True
+            returncode, stdout, stderr = self._exec_script(
+                test_case.edit_script,
+                decode=True,
             )
             if stdout:
                 print(f"  {stdout}")
@@ -268,35 +548,31 @@ class VillintTestRunner:
                 print_status("Creating commit with message from commit file...")
 
                 # Stage all changes
-                run_command(["git", "add", "-A"], cwd=str(self.temp_dir))
+                run_command(["git", "add", "-A"])
 
-                # Check if there are changes to commit
-                returncode, stdout, stderr = run_command(
-                    ["git", "diff", "--cached", "--quiet"],
-                    cwd=str(self.temp_dir),
-                    check=False,
-                )
-
-                if returncode != 0:  # There are staged changes
-                    # Read commit message from file
-                    with open(test_case.commit_file, 'r') as f:
-                        commit_message = f.read().strip()
-
-                    # Create the commit
-                    run_command(
-                        ["git", "commit", "-m", commit_message],
-                        cwd=str(self.temp_dir),
-                    )
+                # Commit straight away; whether anything was staged only needs
+                # checking when the commit fails, to tell "nothing to commit"
+                # apart from a real error without parsing git's messages.
+                commit_cmd = ["git", "commit", "-F", str(test_case.commit_file)]
+                returncode, stdout, stderr = run_command(commit_cmd, check=False)
+                if returncode == 0:
                     print_success(f"  Commit created")
-                else:
+                elif subprocess.call(
+                    ["git", "diff", "--cached", "--quiet"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                ) == 0:
                     print_warning("  No changes to commit (edit script made no modifications)")
+                else:
+                    raise subprocess.CalledProcessError(
+                        returncode, commit_cmd, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+                    )
 
             # Run verify script - should FAIL (violation exists) unless NO_VIOLATION
             if test_case.no_violation:
                 print_status("Verifying no violation exists...")
-                returncode, stdout, stderr = run_command(
-                    ["bash", str(test_case.verify_script)],
-                    cwd=str(self.temp_dir),
+                returncode, stdout, stderr = self._exec_script(
+                    test_case.verify_script,
                     check=False,
                 )
                 if returncode != 0:
@@ -306,9 +582,8 @@ class VillintTestRunner:
                 print_success("  No violation detected (as expected)")
             else:
                 print_status("Verifying violation exists...")
-                returncode, stdout, stderr = run_command(
-                    ["bash", str(test_case.verify_script)],
-                    cwd=str(self.temp_dir),
+                returncode, stdout, stderr = self._exec_script(
+                    test_case.verify_script,
                     check=False,
                 )
                 if returncode == 0:
@@ -323,41 +598,25 @@ class VillintTestRunner:
                 print_status("Recording mtimes for files villint will process...")
 
                 # Get the list of files villint will process (mimics villint.sh logic)
-                # Tracked files that have been modified/added
-                returncode, tracked_files, _ = run_command(
-                    ["git", "diff", "--name-only", "--diff-filter=d", "HEAD"],
-                    cwd=str(self.temp_dir),
-                    check=False,
-                )
-                # New untracked files
-                returncode, untracked_files, _ = run_command(
-                    ["git", "ls-files", "--others", "--exclude-standard"],
-                    cwd=str(self.temp_dir),
-                    check=False,
-                )
-
-                files_to_check = []
-                if tracked_files.strip():
-                    files_to_check.extend(tracked_files.strip().split('\n'))
-                if untracked_files.strip():
-                    files_to_check.extend(untracked_files.strip().split('\n'))
+                files_to_check = self._list_changed_files()
 
+                # One lstat per file; integer nanosecond mtimes compare exactly
                 for file_path in files_to_check:
-                    full_path = self.temp_dir / file_path
-                    if full_path.exists() and full_path.is_file():
-                        mtimes_before[file_path] = full_path.stat().st_mtime
+                    try:
+                        st = os.stat(self.temp_dir / file_path, follow_symlinks=False)
+                    except (FileNotFoundError, NotADirectoryError):
+                        continue
+                    if stat.S_ISREG(st.st_mode):
+                        mtimes_before[file_path] = st.st_mtime_ns
 
                 print_success(f"  Recorded mtimes for {len(mtimes_before)} file(s)")
 
             # Run villint.sh
             print_status("Running villint.sh...")
-            returncode, stdout, stderr = run_command(
+            returncode, stderr = run_command_streaming(
                 ["bash", str(self.villint_script)],
-                cwd=str(self.temp_dir),
                 check=False,
             )
-            if stdout:
-                print(f"  {stdout}")
             if stderr:
                 print(f"  {stderr}")
 
@@ -365,22 +624,27 @@ class VillintTestRunner:
             if test_case.preserve_mtime and mtimes_before:
                 print_status("Verifying mtimes were preserved...")
 
-                files_with_mtime_changes = []
+                mtime_changed = []
 
                 for file_path, old_mtime in mtimes_before.items():
-                    full_path = self.temp_dir / file_path
-                    if full_path.exists():
-                        new_mtime = full_path.stat().st_mtime
-                        if old_mtime != new_mtime:
-                            # Check if file had content changes
-                            returncode, _, _ = run_command(
-                                ["git", "diff", "--quiet", file_path],
-                                cwd=str(self.temp_dir),
-                                check=False,
-                            )
-                            if returncode == 0:
-                                # No content changes but mtime changed!
-                                files_with_mtime_changes.append(file_path)
+                    try:
+                        new_mtime = os.stat(self.temp_dir / file_path, follow_symlinks=False).st_mtime_ns
+                    except (FileNotFoundError, NotADirectoryError):
+                        continue
+                    if old_mtime != new_mtime:
+                        mtime_changed.append(file_path)
+
+                files_with_mtime_changes = []
+                if mtime_changed:
+                    # Check which files had content changes, with one git diff
+                    # for all of them rather than one per file
+                    _, diff_output, _ = run_command(
+                        ["git", "diff", "--name-only", "-z"],
+                        check=False,
+                    )
+                    content_changed = {os.fsdecode(f) for f in diff_output.split(b'\0') if f}
+                    # No content changes but mtime changed!
+                    files_with_mtime_changes = [f for f in mtime_changed if f not in content_changed]
 
                 if files_with_mtime_changes:
                     print_error(f"  Files had mtime changes without content changes:")
@@ -397,9 +661,8 @@ class VillintTestRunner:
 
                     # Verify script should still fail (violation not fixed)
                     print_status("Verifying violation was not fixed...")
-                    returncode, stdout, stderr = run_command(
-                        ["bash", str(test_case.verify_script)],
-                        cwd=str(self.temp_dir),
+                    returncode, stdout, stderr = self._exec_script(
+                        test_case.verify_script,
                         check=False,
                     )
                     if returncode != 0:
@@ -424,9 +687,8 @@ class VillintTestRunner:
 
                 # Run verify script - should PASS (violation fixed)
                 print_status("Verifying violation was fixed...")
-                returncode, stdout, stderr = run_command(
-                    ["bash", str(test_case.verify_script)],
-                    cwd=str(self.temp_dir),
+                returncode, stdout, stderr = self._exec_script(
+                    test_case.verify_script,
                 )
                 print_success("  Violation fixed (verify script passed)")
 
@@ -434,25 +696,23 @@ class VillintTestRunner:
                 print_status("Verifying villint.sh is idempotent...")
 
                 # Commit the fixes from the first run
-                run_command(["git", "add", "-A"], cwd=str(self.temp_dir))
-                run_command(["git", "commit", "-m", "Apply villint fixes"], cwd=str(self.temp_dir), check=False)
+                run_command(["git", "add", "-A"])
+                run_command(["git", "commit", "-m", "Apply villint fixes"], check=False)
 
                 # Run villint.sh again on the committed, fixed files
-                returncode, stdout, stderr = run_command(
+                returncode, stderr = run_command_streaming(
                     ["bash", str(self.villint_script)],
-                    cwd=str(self.temp_dir),
                 )
 
                 # Check if any changes were made
-                returncode, stdout, stderr = run_command(
-                    ["git", "status", "--porcelain"],
-                    cwd=str(self.temp_dir),
-                )
+                changes = self._git_status()
 
-                if stdout.strip():
+                if changes:
                     print_error("  villint.sh made changes on second run!")
                     print_error("  villint.sh is not idempotent")
-                    print(f"  Changes:\n{stdout}")
+                    print("  Changes:")
+                    for status, file_path in changes:
+                        print(f"{status} {file_path}")
                     return False
 
                 print_success("  villint.sh is idempotent (no changes on second run)")
@@ -483,12 +743,41 @@ class VillintTestRunner:
                 print_warning(f"Branch: {self.test_branch}")
             return False
 
+    def run_tests_parallel(self, test_cases: List[TestCase], jobs: int) -> Tuple[int, int]:
+        """Run test cases across worker processes. Returns (passed, failed)."""
+        # Clone once, then workers copy that clone into <temp_dir>_<pid> (where
+        # cleanup_test_repo finds them) instead of each cloning and checking out.
+        # Worktrees can't be copied, so there each worker adds its own.
+        if self.use_worktree:
+            self.temp_dir = self.new_temp_dir()
+        else:
+            self.setup_test_repo()
+        print_status(f"\nRunning {len(test_cases)} test(s) across {jobs} worker(s)...")
+        sys.stdout.flush()
+
+        passed = 0
+        failed = 0
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=setup_worker,
+            initargs=(self.source_dir, self.base_commit, self.temp_dir, self.use_worktree),
+        ) as pool:
+            futures = [pool.submit(run_one, test_case) for test_case in test_cases]
+            for future in as_completed(futures):
+                name, test_passed, output = future.result()
+                print(output, end="")
+                if test_passed:
+                    passed += 1
+                else:
+                    failed += 1
+
+        return passed, failed
+
     def run_all_tests(self, test_filter: str = None) -> int:
         """Run all test cases. Returns number of failed tests."""
         # Check for stale villint test directories
         print_status("Checking for stale test directories...")
-        import glob
-        stale_dirs = glob.glob("/tmp/villint_regtest_*") + glob.glob("/private/tmp/villint_regtest_*")
+        stale_dirs = find_entries("/tmp", "villint_regtest_") + find_entries("/private/tmp", "villint_regtest_")
 
         if stale_dirs:
             print_error("Found stale villint test directories:")
@@ -496,6 +785,10 @@ class VillintTestRunner:
                 print_error(f"  - {d}")
             print_error("\nThese are likely from a previous interrupted test run.")
             print_error("Please clean them up manually with:")
+            # Worktrees must also be dropped from the source repo's registry
+            for d in stale_dirs:
+                if os.path.isfile(os.path.join(d, ".git")):
+                    print_error(f"  git -C {self.source_dir} worktree remove --force {d}")
             print_error(f"  rm -rf /tmp/villint_regtest_*")
             return 1
 
@@ -519,20 +812,32 @@ class VillintTestRunner:
             for tc in test_cases:
                 print(f"  - {tc.name}")
 
+        # Debug mode stops at the first failure and a single test has nothing to
+        # overlap with, so both run serially in one clone.
+        if self.debug or test_filter:
+            jobs = 1
+        else:
+            jobs = max(1, min(self.jobs, len(test_cases)))
+
+        passed = 0
+        failed = 0
+
         try:
-            self.setup_test_repo()
+            self.resolve_base_commit()
 
-            passed = 0
-            failed = 0
+            if jobs > 1:
+                passed, failed = self.run_tests_parallel(test_cases, jobs)
+            else:
+                self.setup_test_repo()
 
-            for test_case in test_cases:
-                if self.run_test_case(test_case):
-                    passed += 1
-                else:
-                    failed += 1
-                    if self.debug:
-                        # Stop on first failure in debug mode
-                        break
+                for test_case in test_cases:
+                    if self.run_test_case(test_case):
+                        passed += 1
+                    else:
+                        failed += 1
+                        if self.debug:
+                            # Stop on first failure in debug mode
+                            break
 
             # Print summary
             print_status(f"\n{'='*60}")
@@ -553,6 +858,37 @@ class VillintTestRunner:
                 print_warning("\nDebug mode: Skipping cleanup to preserve worktree")
 
 
+# Runner owned by the current pool worker process, created by setup_worker()
+_worker_runner = None
+
+
+def setup_worker(source_dir: Path, base_commit: str, template_dir: Path, use_worktree: bool):
+    """Pool initializer: give this worker process its own test clone or worktree"""
+    global _worker_runner
+    _worker_runner = VillintTestRunner(source_dir, use_worktree=use_worktree)
+    _worker_runner.base_commit = base_commit
+    worker_dir = Path(f"{template_dir}_{os.getpid()}")
+    if use_worktree:
+        _worker_runner.setup_test_repo(worker_dir)
+    else:
+        _worker_runner.copy_test_repo(template_dir, worker_dir)
+
+
+def run_one(test_case: TestCase) -> Tuple[str, bool, str]:
+    """Run a test case in this worker's clone. Returns (name, passed, output).
+
+    Output is collected per test so the parent can print each test's log as
+    one block instead of interleaving lines from different workers.
+    """
+    # villint.sh writes into the log directly, and its output (e.g. file
+    # contents from a diff) is not necessarily UTF-8
+    with tempfile.TemporaryFile(mode="w+", errors="replace") as log:
+        with contextlib.redirect_stdout(log):
+            passed = _worker_runner.run_test_case(test_case)
+        log.seek(0)
+        return test_case.name, passed, log.read()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Run villint.sh regression tests",
@@ -581,6 +917,23 @@ def main():
         type=str,
         help="Run only the specified test case (by name)",
     )
+    parser.add_argument(
+        "--use-worktree",
+        action=argparse.BooleanOptionalAction,
+        default=bool(os.environ.get("CI")) and os.environ.get("TERM_PROGRAM") != "vscode",
+        help="Test in detached git worktrees, which are faster to create than clones, "
+             "but write the test commits into the source repo's object store, leaving "
+             "dangling objects behind that may trigger git gc --auto "
+             "(default: on in CI, i.e. when $CI is set, except under VSCode, which "
+             "reports worktree changes)",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=max(1, (os.cpu_count() or 1) - 2),
+        help="Number of test cases to run in parallel, each in its own clone "
+             "(default: CPU count minus 2; --debug and --test always run serially)",
+    )
 
     args = parser.parse_args()
 
@@ -588,7 +941,7 @@ def main():
         print_error(f"Source directory does not exist: {args.source_dir}")
         return 1
 
-    runner = VillintTestRunner(args.source_dir, args.base_branch, args.debug)
+    runner = VillintTestRunner(args.source_dir, args.base_branch, args.debug, args.jobs, args.use_worktree)
     failed_count = runner.run_all_tests(test_filter=args.test)
 
     return 0 if failed_count == 0 else 1